@@ -0,0 +1,320 @@
+"""
+Micro-benchmarks for the data pipeline and the app callbacks.
+
+    python benchmarks/bench.py                       # 1x, 100x and 10000x
+    python benchmarks/bench.py --scales 1,100 --only callbacks,table
+    python benchmarks/bench.py --compare             # last run vs the one before
+
+Each benchmark runs on synthetic events (see synthetic.py) at every scale,
+where scale 1 is the size of fireballs.csv:
+
+load..................read the processed CSV and build the store state
+process_df............clean and geocode the raw events (stub geocoder)
+callback:<output>.....compute of every app callback, named by its output,
+                      with the serialization of the result and its size in
+                      bytes recorded as serialize:<output>
+generate_table........build the events table backend and its first page
+table_page............one sorted and filtered page of the events table
+startup...............`import app` in a fresh interpreter (scale 1 only)
+
+Results are appended to benchmarks/history.jsonl, one JSON object per
+benchmark and scale, tagged with the run time and git commit. A benchmark
+that raises is recorded with its `error` instead of timings and the run
+goes on with the next one. After a run
+every median is compared with the previous run of the same benchmark and
+scale; slowdowns beyond --threshold are reported as regressions.
+
+The 10000x scale is ~7 million events and needs several GB of memory, and
+process_df takes minutes at that size.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_PATH = os.path.join(ROOT, 'benchmarks', 'history.jsonl')
+
+YEAR = 2015
+
+# Input values the callbacks are called with
+INPUT_VALUES = {
+    ('date-slider', 'value'): YEAR,
+    ('xaxis-dd', 'value'): 'energy',
+    ('xaxis-type', 'value'): 'Log',
+    ('yaxis-dd', 'value'): 'vel',
+    ('yaxis-type', 'value'): 'Log',
+    ('map-graph', 'selectedData'): {'points': [], 'range': {'mapbox': [[-30, 60], [30, -10]]}},
+}
+
+SORT_BY = [{'column_id': 'vel', 'direction': 'desc'}]
+FILTER_QUERY = '{year} >= 2005 && {lat-dir} eq S'
+
+
+def measure(func, repeat):
+    """
+    Wall times of `repeat` calls of `func`, and its last result
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def processed_events(scale):
+    """
+    Synthetic events as they come out of process_df, without the geocoding
+    """
+    import synthetic
+    from process_df import clean_df, placeholder_legend
+
+    df = clean_df(synthetic.events(scale, velocity=True))
+    df['legend'] = placeholder_legend(df)
+    return df
+
+
+def bench_load(scale, repeat, workdir):
+    import pandas as pd
+    import store
+
+    path = os.path.join(workdir, 'filtered_data.csv')
+    processed_events(scale).to_csv(path, index=False)
+    times, _ = measure(lambda: store.prepare(pd.read_csv(path)), repeat)
+    yield 'load', times, None
+
+
+def bench_process_df(scale, repeat, workdir):
+    import process_df
+    import synthetic
+
+    raw = synthetic.events(scale)
+    geocode_location = process_df.geocode_location
+    process_df.geocode_location = synthetic.stub_geocode_location
+    stdout = sys.stdout
+    try:
+        # process_df prints a line per event
+        sys.stdout = open(os.devnull, 'w')
+        times, _ = measure(lambda: process_df.process_df(raw.copy()), repeat)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        process_df.geocode_location = geocode_location
+    yield 'process_df', times, None
+
+
+def bench_callbacks(scale, repeat, workdir):
+    import plotly.utils
+    import process_df
+    import store
+    import synthetic
+
+    # With the data already loaded and no real geocoder, importing the app
+    # neither reads nor writes the data files
+    store.use_frame(processed_events(scale))
+    geocode_location = process_df.geocode_location
+    fast_start = os.environ.get('FAST_START')
+    process_df.geocode_location = synthetic.stub_geocode_location
+    os.environ['FAST_START'] = '0'
+    try:
+        import app
+    finally:
+        process_df.geocode_location = geocode_location
+        if fast_start is None:
+            del os.environ['FAST_START']
+        else:
+            os.environ['FAST_START'] = fast_start
+
+    for output, entry in sorted(app.app.callback_map.items()):
+        # the registered function serializes its result, time both apart
+        callback = entry['callback'].__wrapped__
+        args = [INPUT_VALUES[(item['id'], item['property'])] for item in entry['inputs']]
+        try:
+            times, result = measure(lambda: callback(*args), repeat)
+        except Exception as e:
+            yield 'callback:' + output, e, None
+            continue
+        yield 'callback:' + output, times, None
+
+        times, payload = measure(lambda: json.dumps(result, cls=plotly.utils.PlotlyJSONEncoder), repeat)
+        yield 'serialize:' + output, times, len(payload)
+
+
+def bench_table(scale, repeat, workdir):
+    import example_tables
+    from event_table import EventTable
+
+    df = processed_events(scale)
+    df = df[[x for x in df.columns if x != 'legend']]
+
+    times, _ = measure(lambda: example_tables.generate_table(EventTable(df)), repeat)
+    yield 'generate_table', times, None
+
+    table = EventTable(df)
+    times, _ = measure(lambda: table.page(3, example_tables.PAGE_SIZE, SORT_BY, FILTER_QUERY), repeat)
+    yield 'table_page', times, None
+
+
+def bench_startup(scale, repeat, workdir):
+    if scale != 1:
+        return
+    import startup_budget
+
+    times = [startup_budget.measure()['import'] for _ in range(repeat)]
+    yield 'startup', times, None
+
+
+# Each group yields (name, times, bytes or None) per benchmark, or
+# (name, exception, None) for one that failed without stopping the group
+BENCHMARKS = {
+    'load': bench_load,
+    'process_df': bench_process_df,
+    'callbacks': bench_callbacks,
+    'table': bench_table,
+    'startup': bench_startup,
+}
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                      stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode().strip()
+
+
+def read_history(path=HISTORY_PATH):
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(records, history, threshold):
+    """
+    Print each record against the latest earlier one of the same benchmark
+    and scale, return the number of regressions.
+    """
+    previous = {}
+    for record in history:
+        if 'error' not in record:
+            previous[(record['name'], record['scale'])] = record
+
+    regressions = 0
+    print('{:<34}{:>7}{:>12}{:>12}{:>9}'.format('benchmark', 'scale', 'median', 'previous', 'change'))
+    for record in records:
+        if 'error' in record:
+            print('{:<34}{:>7}  FAILED {}'.format(record['name'], record['scale'], record['error']))
+            continue
+        before = previous.get((record['name'], record['scale']))
+        line = '{:<34}{:>7}{:>11.4f}s'.format(record['name'], record['scale'], record['median'])
+        if before is None:
+            print(line)
+            continue
+        change = record['median'] / before['median'] - 1 if before['median'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print('{}{:>11.4f}s{:>+8.1%}{}'.format(line, before['median'], change, flag))
+    return regressions
+
+
+def failure(run, name, scale, error):
+    """
+    History record of a benchmark that raised `error`
+    """
+    lines = str(error).strip().splitlines()
+    message = type(error).__name__ + (': ' + lines[0] if lines else '')
+    print('{:<34}{:>7}  FAILED {}'.format(name, scale, message))
+    return dict(run, name=name, scale=scale, error=message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', default='1,100,10000',
+                        help='comma separated multiples of the fireballs.csv size')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='calls per benchmark, scales above 100 run once')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help='comma separated groups among: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown reported as a regression (0.10 = 10%%)')
+    parser.add_argument('--no-save', action='store_true', help="don't append to the history")
+    parser.add_argument('--compare', action='store_true',
+                        help='only compare the last recorded run with the one before')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'benchmarks')]
+
+    history = read_history()
+    if args.compare:
+        runs = sorted(set(record['run'] for record in history))
+        if not runs:
+            print('no benchmark history yet')
+            return
+        last = [record for record in history if record['run'] == runs[-1]]
+        earlier = [record for record in history if record['run'] != runs[-1]]
+        sys.exit(1 if compare(last, earlier, args.threshold) else 0)
+
+    run = {
+        'run': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+    }
+    records = []
+    workdir = tempfile.mkdtemp(prefix='fireballs-bench-')
+    try:
+        for scale in [float(x) if '.' in x else int(x) for x in args.scales.split(',')]:
+            repeat = args.repeat if scale <= 100 else 1
+            for group in args.only.split(','):
+                try:
+                    for name, times, size in BENCHMARKS[group](scale, repeat, workdir):
+                        if isinstance(times, Exception):
+                            records.append(failure(run, name, scale, times))
+                            continue
+                        record = dict(run, name=name, scale=scale, repeat=len(times),
+                                      median=median(times), min=min(times))
+                        if size is not None:
+                            record['bytes'] = size
+                        records.append(record)
+                        print('{:<34}{:>7}{:>11.4f}s'.format(name, scale, record['median']))
+                except Exception as e:
+                    records.append(failure(run, group, scale, e))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    regressions = compare(records, history, args.threshold)
+
+    if not args.no_save:
+        with open(HISTORY_PATH, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    failed = sum('error' in record for record in records)
+    sys.exit(1 if regressions or failed else 0)
+
+
+if __name__ == '__main__':
+    main()
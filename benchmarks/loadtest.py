@@ -0,0 +1,329 @@
+"""
+Multi-user load test of the Dash server, for sizing the gunicorn workers.
+
+    python benchmarks/loadtest.py --users 20 --duration 60
+    python benchmarks/loadtest.py --workers 1,2,4 --threads 1,4 --users 40
+    python benchmarks/loadtest.py --url http://127.0.0.1:8050 --users 10
+
+Without --url a gunicorn server is started locally as in the Procfile, once
+for every --workers x --threads combination, and stopped afterwards.
+
+Each virtual user replays browsing sessions the way the browser drives the
+app: it reads the callback graph from /_dash-dependencies and the initial
+property values from /_dash-layout, fires the initial callbacks, then
+scrubs the year slider, changes the axis dropdowns and selects map areas,
+sending a `_dash-update-component` POST for every callback an interaction
+triggers, with a think time between interactions.
+
+Reported per run: throughput, error rate and p50/p95/p99 latency for every
+callback output.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from collections import defaultdict
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+YEARS = list(range(1988, 2018))
+AXES = ['energy', 'impact-e', 'alt', 'vel']
+AXIS_TYPES = ['Linear', 'Log']
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not values:
+        return float('nan')
+    rank = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+def get_json(url, timeout=30):
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode())
+
+
+def parse_output(output):
+    """
+    `outputs` field of an update request for a dependency `output` string
+    """
+    def one(spec):
+        component_id, prop = spec.rsplit('.', 1)
+        return {'id': component_id, 'property': prop}
+
+    if output.startswith('..'):
+        # multi output: ..a.children...b.figure..
+        return [one(spec) for spec in output[2:-2].split('...')]
+    return one(output)
+
+
+def layout_values(node, values):
+    """
+    Collect the initial property values of every component with an id
+    """
+    if isinstance(node, list):
+        for child in node:
+            layout_values(child, values)
+    elif isinstance(node, dict):
+        props = node.get('props', {})
+        if 'id' in props:
+            for prop, value in props.items():
+                values[(props['id'], prop)] = value
+        layout_values(props.get('children'), values)
+    return values
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, output, seconds, ok):
+        with self.lock:
+            self.latency[output].append(seconds)
+            if not ok:
+                self.errors[output] += 1
+
+    def report(self, elapsed):
+        with self.lock:
+            total = sum(len(v) for v in self.latency.values())
+            errors = sum(self.errors.values())
+            result = {
+                'requests': total,
+                'errors': errors,
+                'error_rate': errors / float(total) if total else 0.0,
+                'throughput': total / elapsed if elapsed else 0.0,
+                'callbacks': {},
+            }
+            for output, values in sorted(self.latency.items()):
+                values = sorted(values)
+                result['callbacks'][output] = {
+                    'requests': len(values),
+                    'error_rate': self.errors[output] / float(len(values)),
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99),
+                }
+        return result
+
+
+class VirtualUser(threading.Thread):
+    """
+    Replays sessions against `base_url` until `deadline`.
+    """
+
+    def __init__(self, base_url, dependencies, initial, stats, deadline, think_time, seed):
+        super(VirtualUser, self).__init__(name='virtual-user-{}'.format(seed))
+        self.daemon = True
+        self.base_url = base_url
+        self.dependencies = dependencies
+        self.initial = initial
+        self.stats = stats
+        self.deadline = deadline
+        self.think_time = think_time
+        self.random = random.Random(seed)
+
+    def post(self, dependency):
+        payload = {
+            'output': dependency['output'],
+            'outputs': parse_output(dependency['output']),
+            'inputs': [dict(item, value=self.values.get((item['id'], item['property'])))
+                       for item in dependency['inputs']],
+            'state': [dict(item, value=self.values.get((item['id'], item['property'])))
+                      for item in dependency.get('state', [])],
+            'changedPropIds': self.changed,
+        }
+        request = Request(self.base_url + '/_dash-update-component',
+                          data=json.dumps(payload).encode(),
+                          headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        ok = True
+        try:
+            with urlopen(request, timeout=60) as response:
+                response.read()
+        except (URLError, OSError):
+            ok = False
+        self.stats.record(dependency['output'], time.perf_counter() - start, ok)
+
+    def trigger(self, changes):
+        """
+        Apply property changes and fire every callback that depends on them
+        """
+        self.values.update(changes)
+        self.changed = ['{}.{}'.format(*key) for key in changes]
+        for dependency in self.dependencies:
+            if time.time() >= self.deadline:
+                return
+            if any((item['id'], item['property']) in changes for item in dependency['inputs']):
+                self.post(dependency)
+
+    def pause(self):
+        time.sleep(self.random.uniform(*self.think_time))
+
+    def session(self):
+        self.values = dict(self.initial)
+        self.changed = []
+        # page load fires every callback once
+        for dependency in self.dependencies:
+            self.post(dependency)
+        self.pause()
+
+        for _ in range(self.random.randint(3, 8)):
+            if time.time() >= self.deadline:
+                return
+            action = self.random.choice(['scrub', 'scrub', 'axis', 'map'])
+            if action == 'scrub':
+                # dragging the slider goes through neighbouring years quickly
+                year = self.values.get(('date-slider', 'value')) or 2015
+                step = self.random.choice([-1, 1])
+                for _ in range(self.random.randint(2, 6)):
+                    year = min(max(year + step, YEARS[0]), YEARS[-1])
+                    self.trigger({('date-slider', 'value'): year})
+            elif action == 'axis':
+                axis = self.random.choice(['xaxis', 'yaxis'])
+                self.trigger({
+                    (axis + '-dd', 'value'): self.random.choice(AXES),
+                    (axis + '-type', 'value'): self.random.choice(AXIS_TYPES),
+                })
+            else:
+                west = self.random.uniform(-180, 150)
+                south = self.random.uniform(-80, 50)
+                box = [[west, south + 30], [west + 30, south]]
+                self.trigger({('map-graph', 'selectedData'): {'points': [], 'range': {'mapbox': box}}})
+            self.pause()
+
+    def run(self):
+        while time.time() < self.deadline:
+            self.session()
+
+
+def run_load(base_url, users, duration, think_time, seed=0):
+    """
+    Run `users` virtual users for `duration` seconds, return the report
+    """
+    dependencies = get_json(base_url + '/_dash-dependencies')
+    initial = layout_values(get_json(base_url + '/_dash-layout'), {})
+
+    stats = Stats()
+    start = time.time()
+    deadline = start + duration
+    threads = [VirtualUser(base_url, dependencies, initial, stats, deadline, think_time, seed + i)
+               for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.report(time.time() - start)
+
+
+def start_server(port, workers, threads, timeout=120):
+    """
+    Start gunicorn like the Procfile does and wait until every worker has
+    loaded the data
+    """
+    command = [sys.executable, '-m', 'gunicorn', '--pythonpath', './src', 'app:server',
+               '--bind', '127.0.0.1:{}'.format(port),
+               '--workers', str(workers), '--threads', str(threads),
+               '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=ROOT)
+    url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.time() + timeout
+    # every worker loads its own data, /ready tells which one answered
+    ready = set()
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited with {}'.format(process.returncode))
+        try:
+            answer = get_json(url + '/ready', timeout=5)
+            if answer['status'] == 'ready':
+                ready.add(answer['pid'])
+                if len(ready) >= workers:
+                    return process, url
+        except (URLError, OSError, ValueError, KeyError):
+            pass
+        # don't take the CPU from the workers still loading
+        time.sleep(0.1)
+    stop_server(process)
+    raise RuntimeError('server not ready after {}s'.format(timeout))
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def print_report(label, report):
+    print('\n{}: {:.1f} req/s, {} requests, {:.2%} errors'.format(
+        label, report['throughput'], report['requests'], report['error_rate']))
+    print('  {:<28}{:>9}{:>9}{:>9}{:>9}{:>9}'.format('callback', 'requests', 'errors', 'p50', 'p95', 'p99'))
+    for output, row in report['callbacks'].items():
+        print('  {:<28}{:>9}{:>9.1%}{:>8.0f}ms{:>7.0f}ms{:>7.0f}ms'.format(
+            output[:28], row['requests'], row['error_rate'],
+            row['p50'] * 1000, row['p95'] * 1000, row['p99'] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help='test a running server instead of starting gunicorn')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per run')
+    parser.add_argument('--think-time', default='0.2,1.5',
+                        help='min,max seconds between interactions')
+    parser.add_argument('--workers', default='2', help='comma separated gunicorn worker counts')
+    parser.add_argument('--threads', default='1', help='comma separated gunicorn thread counts')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--json', help='also write the reports to this file')
+    args = parser.parse_args()
+
+    think_time = tuple(float(x) for x in args.think_time.split(','))
+
+    reports = []
+    if args.url:
+        report = run_load(args.url.rstrip('/'), args.users, args.duration, think_time)
+        print_report(args.url, report)
+        reports.append(dict(report, url=args.url, users=args.users))
+    else:
+        for workers in [int(x) for x in args.workers.split(',')]:
+            for threads in [int(x) for x in args.threads.split(',')]:
+                process, url = start_server(args.port, workers, threads)
+                try:
+                    report = run_load(url, args.users, args.duration, think_time)
+                finally:
+                    stop_server(process)
+                print_report('workers={} threads={}'.format(workers, threads), report)
+                reports.append(dict(report, workers=workers, threads=threads, users=args.users))
+
+        if len(reports) > 1:
+            print('\n{:>8}{:>8}{:>10}{:>9}{:>11}'.format('workers', 'threads', 'req/s', 'errors', 'worst p95'))
+            for report in reports:
+                p95 = max(row['p95'] for row in report['callbacks'].values()) if report['callbacks'] else 0
+                print('{:>8}{:>8}{:>10.1f}{:>9.2%}{:>9.0f}ms'.format(
+                    report['workers'], report['threads'], report['throughput'],
+                    report['error_rate'], p95 * 1000))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Synthetic fireball events for benchmarking at scaled dataset sizes.
+
+`events(scale)` returns `scale` times as many rows as fireballs.csv with
+the same schema. Numeric columns are resampled jointly from the real
+events, so value distributions and missing-value patterns match; dates and
+coordinates are drawn fresh so every row is a distinct event.
+
+`stub_geocode_location` stands in for the Google reverse geocoding.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+
+RAW_PATH = 'src/data/fireballs.csv'
+
+# Columns resampled from the real events, lat/lon only for their NaN pattern
+SAMPLED_COLUMNS = ['energy', 'impact-e', 'lat', 'lon', 'alt', 'vel']
+
+FIRST_DATE = np.datetime64('1988-01-01T00:00:00')
+LAST_DATE = np.datetime64('2017-12-31T23:59:59')
+
+COUNTRIES = ['AU', 'BR', 'CA', 'CN', 'ES', 'IN', 'RU', 'US', 'N/A']
+
+
+def events(scale=1, seed=0, velocity=False):
+    """
+    df: pd.DataFrame with the fireballs.csv columns, len(fireballs) * scale rows
+
+    velocity: add pre-entry velocity components vx/vy/vz
+    """
+    rng = np.random.RandomState(seed)
+    real = pd.read_csv(RAW_PATH)
+    n = int(len(real) * scale)
+
+    df = real[SAMPLED_COLUMNS].iloc[rng.randint(0, len(real), n)].reset_index(drop=True)
+
+    span = (LAST_DATE - FIRST_DATE).astype(np.int64)
+    dates = FIRST_DATE + rng.randint(0, span, n).astype('timedelta64[s]')
+    df.insert(0, 'date', np.char.replace(dates.astype(str), 'T', ' '))
+
+    # Uniform on the sphere, unsigned with N/S E/W directions as in the API
+    missing = df['lat'].isna().to_numpy()
+    lat = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    lon = rng.uniform(-180, 180, n)
+    df['lat'] = np.where(missing, np.nan, np.round(np.abs(lat), 1))
+    df['lon'] = np.where(missing, np.nan, np.round(np.abs(lon), 1))
+    df.insert(4, 'lat-dir', np.where(missing, None, np.where(lat < 0, 'S', 'N')))
+    df.insert(6, 'lon-dir', np.where(missing, None, np.where(lon < 0, 'W', 'E')))
+
+    if velocity:
+        # Random incoming directions, speed from vel where known
+        speed = df['vel'].fillna(20.0).to_numpy()
+        direction = rng.normal(size=(n, 3))
+        direction /= np.linalg.norm(direction, axis=1)[:, None]
+        for i, col in enumerate(['vx', 'vy', 'vz']):
+            df[col] = np.round(direction[:, i] * speed, 1)
+
+    return df
+
+
+def stub_geocode_location(lat, lon, latency=0.0):
+    """
+    Deterministic replacement for process_df.geocode_location
+    """
+    if latency:
+        time.sleep(latency)
+    country = COUNTRIES[int(abs(lat) + abs(lon)) % len(COUNTRIES)]
+    city = 'City{}'.format(int(abs(lat * lon)) % 1000)
+    return "Location: {},{}<br>".format(city, country)
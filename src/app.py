@@ -19,21 +19,32 @@ vx..........pre-entry estimated velocity (Earth centered X component, km/s)
 vy..........pre-entry est. velocity (Earth centered Y component, km/s)
 vz..........pre-entry est. velocity (Earth centered Z component, km/s)
 
+Derived metrics (speed, entry angle, radiant, energy conversions, mass) are
+added by `physics` and offered in the axis explorer next to these fields.
+
 """
 
 import os
 
+from urllib.parse import urlencode
+
 import color_scale
 import dash
+import enrichment
+import export
+import metrics
+import store
 
 import dash_core_components as dcc
 import dash_html_components as html
-import numpy as np
-import pandas as pd
-import plotly.graph_objs as go
 
 from dash.dependencies import Input, Output
-from process_df import process_df
+from flask import jsonify
+
+# numpy, pandas and plotly.graph_objs are imported where they are used so
+# that importing this module (and booting gunicorn) stays cheap. Set
+# FAST_START=0 to load the data before serving instead.
+FAST_START = os.environ.get('FAST_START', '1') != '0'
 
 
 mapbox_access_token = 'pk.eyJ1IjoiaXZhbm5pZXRvIiwiYSI6ImNqNTU0dHFrejBkZmoycW9hZTc5NW42OHEifQ._bi-c17fco0GQVetmZq0Hw'
@@ -54,306 +65,362 @@ app.css.append_css({
     "external_url": [css_bootstrap_url, css_url],
 })
 
-# Read CSV file
-if(os.path.isfile('src/data/filtered_data.csv')):
-    df = pd.read_csv('src/data/filtered_data.csv')
+# Load the data, in the background unless fast start is off
+if FAST_START:
+    store.warm_up()
 else:
-    df = pd.read_csv('src/data/fireballs.csv')
-    df = process_df(df)
-    df.to_csv('src/data/filtered_data.csv', index=False)
-
-
-dfmax = df.groupby('year', as_index=False)[
-    'alt', 'vel', 'impact-e', 'energy'].max()
-
-dfmean = df.groupby('year', as_index=False)[
-    'alt', 'vel', 'impact-e', 'energy'].mean()
-
-dfmedian = df.groupby('year', as_index=False)[
-    'alt', 'vel', 'impact-e', 'energy'].median()
-
-# Get all valuable column headers
-to_skip = ['lat', 'lat-dir', 'lon', 'lon-dir', 'year', 'date']
-main_columns = [x for x in df.columns if x not in to_skip]
-
-# Filter impact-e values < 10kt
-df['impact-e'] = np.clip(df['impact-e'].values, 10, df['impact-e'].max())
-
-# Layout generation
-app.layout = html.Div([
-    # LANDING
-    html.Div(
-        className='section',
-        children=[
-            html.H1('GREAT BALLS OF FIRE', className='landing-text')
-        ]
-    ),
-    html.Div(
-        className='content',
-        children=[
-            # SLIDER ROW
-            html.Div(
-                className='col',
-                children=[
-                  html.Div(
-                      id='slider',
-                      children=[
-                          dcc.Slider(
-                              id='date-slider',
-                              min=min(df['year']),
-                              max=max(df['year']),
-                              marks={str(date): str(date)
-                                     for date in df['year'].unique()},
-                              value=2015,
-                          ),
-                      ], style={
-                          'background': '#191a1a',
-                          'margin-bottom': '50px'
-                      }
-                  )
-                ], style={
-                    'background': '#191a1a',
-                }),
-            # GRAPHS ROW
-            html.Div(
-                id='graphs',
-                className='row',
-                children=[
-                    html.Div(
-                        className='col-4',
-                        children=[
-                          dcc.Graph(
-                              id='freq-graph',
-                          ),
-                        ]),
-                    html.Div(
-                        className='col-4',
-                        children=[
-                            dcc.Graph(
-                                id='another-graph',
-                            ),
-                        ]),
-                    html.Div(
-                        className='col-4',
-                        children=[
-                            dcc.Graph(
-                                id='plot-graph',
-                            ),
-                        ])
-                ], style={
-                    'padding-bottom': 100
-                }
-            ),
-            # INFO ROW
-            html.Div(
-                id='group-x',
-                className='row',
-                children=[
-                    html.Div(
-                        className='col-6',
-                        children=[
-                          html.Div(
-                              className='row',
-                              children=[
-                                  html.Div(
-                                      className='col-3',
-                                      children=[
-                                          html.H1(
-                                              id='this-year',
-                                              style={
-                                                  'fontSize': 60,
-                                                  'color': '#FFF'
-                                              }
-                                          ),
-                                      ]
-                                  ),
-                                  html.Div(
-                                      className='col-3',
-                                      children=[
-                                          html.H3(
-                                              'Max radiated impact energy',
-                                              id='this-year-1st',
-                                              style={
-                                                  'fontSize': 12,
-                                                  'color': '#FFF'
-                                              }
-                                          ),
-                                          html.H1(
-                                              id='max-energy',
-                                              style={
-                                                  'fontSize': 30,
-                                                  'color': '#FFF'
-                                              }
-                                          )
-                                      ]),
-                                  html.Div(
-                                      className='col-3',
-                                      children=[
-                                          html.H3(
-                                              'Max velocity at peak brightness',
-                                              id='this-year-2nd',
-                                              style={
-                                                  'fontSize': 12,
-                                                  'color': '#FFF'
-                                              }
-                                          ),
-                                          html.H1(
-                                              id='max-velocity',
-                                              style={
-                                                  'fontSize': 30,
-                                                  'color': '#FFF'
-                                              }
-                                          )
-                                      ]),
-                                  html.Div(
-                                      className='col-3',
-                                      children=[
-                                          html.H3(
-                                              'Max impact energy',
-                                              id='this-year-3rd',
-                                              style={
-                                                  'fontSize': 12,
-                                                  'color': '#FFF'
-                                              }
-                                          ),
-                                          html.H1(
-                                              id='max-impact-e',
-                                              style={
-                                                  'fontSize': 30,
-                                                  'color': '#FFF'
-                                              }
-                                          )
-                                      ])
-                              ]),
-
-                        ]),
-                    html.Div(
-                        className='col-3',
-                        children=[
-                            dcc.Dropdown(
-                                id='xaxis-dd',
-                                className='col',
-                                options=[{'label': i, 'value': i}
-                                         for i in main_columns],
-                                value='energy',
-                            ),
-                            html.Div(
-                                className='col radius-group',
-                                children=[
-                                    dcc.RadioItems(
-                                        id='xaxis-type',
-                                        options=[
-                                          {'label': i, 'value': i} for i in ['Linear', 'Log']
-                                        ],
-                                        value='log',
-                                        labelStyle={
-                                            'color': '#FFF'
-                                        }
-                                    ),
-                                ])
-                        ]),
-                    html.Div(
-                        className='col-3',
-                        children=[
-                            dcc.Dropdown(
-                                id='yaxis-dd',
-                                className='col',
-                                options=[{'label': i, 'value': i}
-                                         for i in main_columns],
-                                value='vel',
-                            ),
-                            html.Div(
-                                className='col radius-group',
-                                children=[
-                                    dcc.RadioItems(
-                                        id='yaxis-type',
-                                        options=[
-                                          {'label': i, 'value': i} for i in ['Linear', 'Log']
-                                        ],
-                                        value='log',
-                                        labelStyle={
-                                            'color': '#FFF'
-                                        }
-                                    ),
-                                ])
-                        ]),
-                ]
-            ),
-            # MAP ROW
-            html.Div(
-                className='row',
-                children=[
-                    # Main graph holding the map
-                    dcc.Graph(
-                        id='map-graph',
-                        animate=True,
-                        style={
-                          'width': '100%',
-                          'height': 800,
-                        }
-                    ),
-                ]),
-            # ABOUT ROW
-            html.Div(
-                className='row',
-                children=[
-                  html.Div(
+    store.load()
+
+
+@server.route('/ready')
+def ready():
+    """
+    Readiness check, 200 once the data is loaded
+    """
+    if store.is_ready():
+        return jsonify(status='ready', pid=os.getpid())
+    if store.error() is not None:
+        return jsonify(status='error', error=str(store.error()), pid=os.getpid()), 500
+    return jsonify(status='loading', pid=os.getpid()), 503
+
+
+@server.route('/enrichment')
+def enrichment_progress():
+    """
+    Progress of the background geocoding of the legends
+    """
+    return jsonify(**enrichment.progress())
+
+
+# Bulk download of the events behind the current view
+export.register_export(server, store.frame)
+
+# Latency, payload and error metrics of every callback at /metrics
+metrics.instrument(app)
+
+
+def serve_layout():
+    """
+    Layout generation, independent of the data so it never waits for it
+    """
+    meta = store.layout_meta()
+    years = meta['years']
+    main_columns = meta['main_columns']
+    return html.Div([
+        # LANDING
+        html.Div(
+            className='section',
+            children=[
+                html.H1('GREAT BALLS OF FIRE', className='landing-text')
+            ]
+        ),
+        html.Div(
+            className='content',
+            children=[
+                # SLIDER ROW
+                html.Div(
                     className='col',
                     children=[
-                      html.P(
-                        'Data extracted from:'
-                      ),
-                      html.A(
-                          'NASA Fireballs open API',
-                          href='https://ssd-api.jpl.nasa.gov/doc/fireball.html'
-                      )                    
-                    ]
-                  ),
-                  html.Div(
-                    className='col',
+                      html.Div(
+                          id='slider',
+                          children=[
+                              dcc.Slider(
+                                  id='date-slider',
+                                  min=min(years),
+                                  max=max(years),
+                                  marks={str(date): str(date)
+                                         for date in years},
+                                  value=2015,
+                              ),
+                          ], style={
+                              'background': '#191a1a',
+                              'margin-bottom': '50px'
+                          }
+                      )
+                    ], style={
+                        'background': '#191a1a',
+                    }),
+                # GRAPHS ROW
+                html.Div(
+                    id='graphs',
+                    className='row',
                     children=[
-                      html.P(
-                        'Code avaliable at:'
-                      ),
-                      html.A(
-                          'BitBucket',
-                          href='https://bitbucket.org/inieto/great-balls-of-fire/'
-                      )                    
-                    ]
-                  ),
-                  html.Div(
-                    className='col',
+                        html.Div(
+                            className='col-4',
+                            children=[
+                              dcc.Graph(
+                                  id='freq-graph',
+                              ),
+                            ]),
+                        html.Div(
+                            className='col-4',
+                            children=[
+                                dcc.Graph(
+                                    id='another-graph',
+                                ),
+                            ]),
+                        html.Div(
+                            className='col-4',
+                            children=[
+                                dcc.Graph(
+                                    id='plot-graph',
+                                ),
+                            ])
+                    ], style={
+                        'padding-bottom': 100
+                    }
+                ),
+                # INFO ROW
+                html.Div(
+                    id='group-x',
+                    className='row',
                     children=[
-                      html.P(
-                        'Made with:'
-                      ),
-                      html.A(
-                          'Dash / Plot.ly',
-                          href='https://plot.ly/dash/'
-                      )                    
+                        html.Div(
+                            className='col-6',
+                            children=[
+                              html.Div(
+                                  className='row',
+                                  children=[
+                                      html.Div(
+                                          className='col-3',
+                                          children=[
+                                              html.H1(
+                                                  id='this-year',
+                                                  style={
+                                                      'fontSize': 60,
+                                                      'color': '#FFF'
+                                                  }
+                                              ),
+                                          ]
+                                      ),
+                                      html.Div(
+                                          className='col-3',
+                                          children=[
+                                              html.H3(
+                                                  'Max radiated impact energy',
+                                                  id='this-year-1st',
+                                                  style={
+                                                      'fontSize': 12,
+                                                      'color': '#FFF'
+                                                  }
+                                              ),
+                                              html.H1(
+                                                  id='max-energy',
+                                                  style={
+                                                      'fontSize': 30,
+                                                      'color': '#FFF'
+                                                  }
+                                              )
+                                          ]),
+                                      html.Div(
+                                          className='col-3',
+                                          children=[
+                                              html.H3(
+                                                  'Max velocity at peak brightness',
+                                                  id='this-year-2nd',
+                                                  style={
+                                                      'fontSize': 12,
+                                                      'color': '#FFF'
+                                                  }
+                                              ),
+                                              html.H1(
+                                                  id='max-velocity',
+                                                  style={
+                                                      'fontSize': 30,
+                                                      'color': '#FFF'
+                                                  }
+                                              )
+                                          ]),
+                                      html.Div(
+                                          className='col-3',
+                                          children=[
+                                              html.H3(
+                                                  'Max impact energy',
+                                                  id='this-year-3rd',
+                                                  style={
+                                                      'fontSize': 12,
+                                                      'color': '#FFF'
+                                                  }
+                                              ),
+                                              html.H1(
+                                                  id='max-impact-e',
+                                                  style={
+                                                      'fontSize': 30,
+                                                      'color': '#FFF'
+                                                  }
+                                              )
+                                          ])
+                                  ]),
+
+                            ]),
+                        html.Div(
+                            className='col-3',
+                            children=[
+                                dcc.Dropdown(
+                                    id='xaxis-dd',
+                                    className='col',
+                                    options=[{'label': i, 'value': i}
+                                             for i in main_columns],
+                                    value='energy',
+                                ),
+                                html.Div(
+                                    className='col radius-group',
+                                    children=[
+                                        dcc.RadioItems(
+                                            id='xaxis-type',
+                                            options=[
+                                              {'label': i, 'value': i} for i in ['Linear', 'Log']
+                                            ],
+                                            value='log',
+                                            labelStyle={
+                                                'color': '#FFF'
+                                            }
+                                        ),
+                                    ])
+                            ]),
+                        html.Div(
+                            className='col-3',
+                            children=[
+                                dcc.Dropdown(
+                                    id='yaxis-dd',
+                                    className='col',
+                                    options=[{'label': i, 'value': i}
+                                             for i in main_columns],
+                                    value='vel',
+                                ),
+                                html.Div(
+                                    className='col radius-group',
+                                    children=[
+                                        dcc.RadioItems(
+                                            id='yaxis-type',
+                                            options=[
+                                              {'label': i, 'value': i} for i in ['Linear', 'Log']
+                                            ],
+                                            value='log',
+                                            labelStyle={
+                                                'color': '#FFF'
+                                            }
+                                        ),
+                                    ])
+                            ]),
                     ]
-                  ),
-                  html.Div(
-                    className='col',
+                ),
+                # MAP ROW
+                html.Div(
+                    className='row',
+                    children=[
+                        # Main graph holding the map
+                        dcc.Graph(
+                            id='map-graph',
+                            animate=True,
+                            style={
+                              'width': '100%',
+                              'height': 800,
+                            }
+                        ),
+                    ]),
+                # EXPORT ROW
+                html.Div(
+                    className='row',
                     children=[
-                      html.P(
-                        'Developer:'
+                        html.Div(
+                            className='col',
+                            children=[
+                                html.A(
+                                    'Download these events (CSV)',
+                                    id='export-csv',
+                                    href='/export?format=csv',
+                                ),
+                                html.Span(' | '),
+                                html.A(
+                                    'GeoJSON',
+                                    id='export-geojson',
+                                    href='/export?format=geojson',
+                                ),
+                                html.Span(' | '),
+                                html.A(
+                                    'Arrow',
+                                    id='export-arrow',
+                                    href='/export?format=arrow',
+                                ),
+                            ]
+                        )
+                    ], style={
+                        'padding': '20px 0'
+                    }),
+                # ABOUT ROW
+                html.Div(
+                    className='row',
+                    children=[
+                      html.Div(
+                        className='col',
+                        children=[
+                          html.P(
+                            'Data extracted from:'
+                          ),
+                          html.A(
+                              'NASA Fireballs open API',
+                              href='https://ssd-api.jpl.nasa.gov/doc/fireball.html'
+                          )                    
+                        ]
+                      ),
+                      html.Div(
+                        className='col',
+                        children=[
+                          html.P(
+                            'Code avaliable at:'
+                          ),
+                          html.A(
+                              'BitBucket',
+                              href='https://bitbucket.org/inieto/great-balls-of-fire/'
+                          )                    
+                        ]
+                      ),
+                      html.Div(
+                        className='col',
+                        children=[
+                          html.P(
+                            'Made with:'
+                          ),
+                          html.A(
+                              'Dash / Plot.ly',
+                              href='https://plot.ly/dash/'
+                          )                    
+                        ]
                       ),
-                      html.A(
-                          'Ivan Nieto',
-                          href='https://twitter.com/IvanNietoS'
-                      )                    
+                      html.Div(
+                        className='col',
+                        children=[
+                          html.P(
+                            'Developer:'
+                          ),
+                          html.A(
+                              'Ivan Nieto',
+                              href='https://twitter.com/IvanNietoS'
+                          )                    
+                        ]
+                      )                                                          
                     ]
-                  )                                                          
-                ]
-            )
-        ],
-        style={
-            'padding': 40
-        }
+                )
+            ],
+            style={
+                'padding': 40
+            }
+        )
+    ]
     )
-]
-)
+
+
+app.layout = serve_layout
+
+
+def marker_impact(dff):
+    """
+    Impact energy for marker sizes and colors, events < 10kt drawn as 10kt
+    """
+    import numpy as np
+
+    return np.clip(dff['impact-e'].values, 10, None)
 
 
 @app.callback(
@@ -375,6 +442,7 @@ def update_text(year_value):
     """
     Callback for energy digit col
     """    # data from current selected year
+    df = store.frame()
     dff = df[df['year'] == year_value]
     return '{} joules'.format(str(dff['energy'].max()))
 
@@ -387,7 +455,10 @@ def update_text(year_value):
     """
     Callbacks for velocity digit col
     """
+    import numpy as np
+
     # data from current selected year
+    df = store.frame()
     dff = df[df['year'] == year_value]
     if(np.isnan(dff['vel'].max())):
         return 'N/A'
@@ -403,6 +474,7 @@ def update_text(year_value):
     Callback for impact-e text col
     """
     # data from current selected year
+    df = store.frame()
     dff = df[df['year'] == year_value]
     return '{} kt'.format(str(dff['impact-e'].max()))
 
@@ -415,6 +487,12 @@ def update_graph(year_value):
     """
     Top Left graph callback
     """
+    import numpy as np
+    import plotly.graph_objs as go
+
+    dfmax = store.stats('max')
+    dfmean = store.stats('mean')
+    dfmedian = store.stats('median')
 
     data = go.Data([
         go.Scatter(
@@ -502,6 +580,9 @@ def update_mid(year_value):
     """
     Top Mid graph callback
     """
+    import plotly.graph_objs as go
+
+    df = store.frame()
 
     traces = []
     marker_color = ''
@@ -572,7 +653,9 @@ def update_plot(year_value, xaxis_value, xaxis_type, yaxis_value, yaxis_type):
     """
     Top Right graph callback
     """
+    import plotly.graph_objs as go
 
+    df = store.frame()
     dff = df[df['year'] == year_value]
     data = go.Data([
         go.Scatter(
@@ -582,7 +665,7 @@ def update_plot(year_value, xaxis_value, xaxis_type, yaxis_value, yaxis_type):
             mode='markers',
             marker={
                 'symbol': 'circle',
-                'size': dff['impact-e'],
+                'size': marker_impact(dff),
                 'color': '#C2FF0A'
             },
             hoverlabel={
@@ -631,9 +714,13 @@ def update_map(year_value):
     """
     Map graph callback
     """
+    import plotly.graph_objs as go
+
+    df = store.frame()
 
     # Update dataframe with the passed value
     dff = df[df['year'] == year_value]
+    impact = marker_impact(dff)
 
     # Paint mapbox into the data
     data = go.Data([
@@ -643,11 +730,11 @@ def update_map(year_value):
             mode='markers',
             marker=go.Marker(
                 # size=dff['vel']
-                size=dff['impact-e'],
+                size=impact,
                 colorscale=color_scale,
-                cmin=dff['impact-e'].min(),
-                color=dff['impact-e'],
-                cmax=dff['impact-e'].max(),
+                cmin=impact.min(initial=10),
+                color=impact,
+                cmax=impact.max(initial=10),
                 colorbar=dict(
                     title='Impact'
                 ),
@@ -688,6 +775,54 @@ def update_map(year_value):
     )
 
 
+def export_query(year_value, selected_data):
+    """
+    Query string for /export matching the selected year and map box selection
+    """
+    params = [('year', year_value)]
+    if selected_data and 'range' in selected_data and 'mapbox' in selected_data['range']:
+        (west, north), (east, south) = selected_data['range']['mapbox']
+        params.append(('bbox', '{},{},{},{}'.format(
+            min(west, east), min(north, south), max(west, east), max(north, south))))
+    return params
+
+
+@app.callback(
+    Output('export-csv', 'href'),
+    [Input('date-slider', 'value'),
+     Input('map-graph', 'selectedData')]
+)
+def update_export_csv(year_value, selected_data):
+    """
+    Callback for the CSV download link
+    """
+    return '/export?' + urlencode([('format', 'csv')] + export_query(year_value, selected_data))
+
+
+@app.callback(
+    Output('export-geojson', 'href'),
+    [Input('date-slider', 'value'),
+     Input('map-graph', 'selectedData')]
+)
+def update_export_geojson(year_value, selected_data):
+    """
+    Callback for the GeoJSON download link
+    """
+    return '/export?' + urlencode([('format', 'geojson')] + export_query(year_value, selected_data))
+
+
+@app.callback(
+    Output('export-arrow', 'href'),
+    [Input('date-slider', 'value'),
+     Input('map-graph', 'selectedData')]
+)
+def update_export_arrow(year_value, selected_data):
+    """
+    Callback for the Arrow download link
+    """
+    return '/export?' + urlencode([('format', 'arrow')] + export_query(year_value, selected_data))
+
+
 # Run dash server
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,278 @@
+"""
+Background geocoding of the event legends.
+
+When there is no processed data file yet, the app serves the raw events
+straight away with placeholder legends and this module fills in the
+locations batch by batch:
+
+- the work queue is persisted in CHECKPOINT_PATH, one
+  `position,date,location` row per geocoded event, so a restart only
+  geocodes what is still missing. Events are keyed by row position, as
+  several can share a date; the date only guards against a checkpoint left
+  by a different events file
+- an flock on LOCK_PATH makes a single process (gunicorn worker) do the
+  geocoding; the others follow the checkpoint file and pick up its
+  results. The OS drops the lock when its holder dies, and a follower
+  then takes over. The holder also writes its state to the lock file, so
+  followers stop waiting when it gives up with events left to geocode
+- once every event is geocoded the processed data file is written and the
+  checkpoint removed, later boots read that file directly
+
+`progress()` reports how far along the job is.
+"""
+
+import csv
+import fcntl
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+CHECKPOINT_PATH = 'src/data/enrichment_checkpoint.csv'
+LOCK_PATH = 'src/data/enrichment.lock'
+
+BATCH_SIZE = int(os.environ.get('ENRICH_BATCH_SIZE', 20))
+WORKERS = int(os.environ.get('ENRICH_WORKERS', 4))
+POLL_SECONDS = 5
+
+_progress = {
+    'state': 'idle',
+    'role': None,
+    'done': 0,
+    'failed': 0,
+    'total': 0,
+    'started': None,
+    'finished': None,
+}
+_progress_lock = threading.Lock()
+
+
+def progress():
+    """
+    Snapshot of the enrichment job progress.
+    """
+    with _progress_lock:
+        state = dict(_progress)
+    if state['started'] is not None:
+        state['elapsed'] = (state['finished'] or time.time()) - state['started']
+    return state
+
+
+def _update(**kwargs):
+    with _progress_lock:
+        _progress.update(kwargs)
+
+
+def read_checkpoint(path=CHECKPOINT_PATH):
+    """
+    Locations already geocoded, {row position: (date, location)}.
+    """
+    if not os.path.isfile(path):
+        return {}
+    with open(path, newline='') as f:
+        return {int(row[0]): (row[1], row[2]) for row in csv.reader(f) if len(row) == 3}
+
+
+_lock_file = None
+
+
+def acquire_lock(path=LOCK_PATH):
+    """
+    Take the job lock without blocking, False if another process has it.
+    """
+    global _lock_file
+    if _lock_file is not None:
+        return True
+    f = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _lock_file = f
+    write_lock_state('running')
+    return True
+
+
+def write_lock_state(state):
+    """
+    Publish the state of the job held under the lock.
+    """
+    _lock_file.seek(0)
+    _lock_file.truncate()
+    _lock_file.write(json.dumps({'pid': os.getpid(), 'state': state}))
+    _lock_file.flush()
+
+
+def read_lock_state(path=LOCK_PATH):
+    try:
+        with open(path) as f:
+            return json.loads(f.read() or '{}').get('state')
+    except (OSError, ValueError):
+        return None
+
+
+def release_lock():
+    global _lock_file
+    if _lock_file is None:
+        return
+    # The file stays, removing it would let a second process lock a new one
+    fcntl.flock(_lock_file, fcntl.LOCK_UN)
+    _lock_file.close()
+    _lock_file = None
+
+
+def _locate(point):
+    from process_df import geocode_location
+
+    try:
+        return geocode_location(*point)
+    except Exception:
+        return None
+
+
+class Enricher(object):
+    """
+    Geocoding job over a cleaned events DataFrame.
+
+    df: pd.DataFrame with placeholder legends, as produced by
+        process_df.clean_df/placeholder_legend (impact-e not clipped)
+    output_path: where the fully processed data is written at the end
+    apply: callable(positions, legends) receiving every batch of
+        finished legends
+    """
+
+    def __init__(self, df, output_path, apply):
+        self.df = df.reset_index(drop=True)
+        self.output_path = output_path
+        self.apply = apply
+        self.dates = self.df['date'].tolist()
+        self.owner = False
+
+    def _checkpointed(self):
+        """
+        {position: location} of the checkpoint entries matching our events
+        """
+        return {i: location for i, (date, location) in read_checkpoint().items()
+                if i < len(self.dates) and self.dates[i] == date}
+
+    def _apply(self, locations):
+        """
+        Publish the legends of a {position: location} mapping
+        """
+        from process_df import format_legend
+
+        positions = list(locations)
+        if positions:
+            legends = [format_legend(locations[i], self.df['impact-e'][i], self.dates[i])
+                       for i in positions]
+            self.df.loc[positions, 'legend'] = legends
+            self.apply(positions, legends)
+        return len(positions)
+
+    def run(self):
+        _update(state='running', total=len(self.df), started=time.time(), finished=None)
+        try:
+            if acquire_lock():
+                self.owner = True
+                _update(role='worker')
+                self.work()
+            else:
+                _update(role='follower')
+                self.follow()
+        except Exception:
+            if self.owner:
+                release_lock()
+            _update(state='failed', finished=time.time())
+            raise
+
+    def work(self):
+        """
+        Geocode every event missing from the checkpoint.
+        """
+        known = self._checkpointed()
+        done = self._apply(known)
+        pending = [i for i in range(len(self.df)) if i not in known]
+        failed = 0
+        _update(done=done)
+
+        with ThreadPoolExecutor(WORKERS) as pool, \
+                open(CHECKPOINT_PATH, 'a', newline='') as checkpoint:
+            writer = csv.writer(checkpoint)
+            for start in range(0, len(pending), BATCH_SIZE):
+                batch = pending[start:start + BATCH_SIZE]
+                points = [(self.df['lat'][i], self.df['lon'][i]) for i in batch]
+                locations = {}
+                for i, location in zip(batch, pool.map(_locate, points)):
+                    if location is None:
+                        failed += 1
+                    else:
+                        locations[i] = location
+
+                # persist before publishing, a restart must not redo them
+                writer.writerows((i, self.dates[i], location) for i, location in locations.items())
+                checkpoint.flush()
+                done += self._apply(locations)
+                _update(done=done, failed=failed)
+
+        if failed:
+            # The failed ones stay queued for the next start. The lock is
+            # kept until this process exits so the other workers don't
+            # retry against an API that is refusing us, they stop too.
+            write_lock_state('incomplete')
+            _update(state='incomplete', finished=time.time())
+            return
+
+        tmp_path = self.output_path + '.tmp'
+        self.df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.output_path)
+        os.remove(CHECKPOINT_PATH)
+        release_lock()
+        _update(state='done', finished=time.time())
+
+    def follow(self):
+        """
+        Pick up the results of the process holding the lock.
+        """
+        known = {}
+        while True:
+            if os.path.isfile(self.output_path):
+                with open(self.output_path, newline='') as f:
+                    # written from the same events, row for row
+                    finished = {i: row['legend'] for i, row in enumerate(csv.DictReader(f))
+                                if i < len(self.dates) and row['date'] == self.dates[i]}
+                positions = list(finished)
+                self.apply(positions, [finished[i] for i in positions])
+                _update(state='done', done=len(positions), finished=time.time())
+                return
+
+            locations = self._checkpointed()
+            new = {i: loc for i, loc in locations.items() if i not in known}
+            if new:
+                self._apply(new)
+                known.update(new)
+                _update(done=len(known))
+
+            if acquire_lock():
+                # the worker went away without finishing, take over
+                self.owner = True
+                _update(role='worker')
+                return self.work()
+            if read_lock_state() == 'incomplete':
+                _update(state='incomplete', finished=time.time())
+                return
+            time.sleep(POLL_SECONDS)
+
+
+def start(df, output_path, apply):
+    """
+    Run the enrichment of `df` in a background thread.
+    """
+    enricher = Enricher(df, output_path, apply)
+    thread = threading.Thread(target=enricher.run, name='enrichment')
+    thread.daemon = True
+    thread.start()
+    return thread
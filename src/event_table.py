@@ -0,0 +1,197 @@
+"""
+Server-side paging, sorting and filtering for the events DataTable.
+
+The table only ever ships the visible page to the browser. Sorting is
+served from a per-column sort index built once at load time, so an
+unfiltered page is a slice of that index no matter how many events there
+are. Filters are evaluated as vectorized masks and cached together with
+the resulting row order, so flipping through pages of the same query
+doesn't recompute anything.
+"""
+
+import re
+
+from functools import lru_cache
+
+import numpy as np
+
+
+# Operators understood by dash_table's `filter_query` syntax, longest first
+# so that '>=' wins over '>'.
+OPERATORS = [
+    ['ge ', '>='],
+    ['le ', '<='],
+    ['lt ', '<'],
+    ['gt ', '>'],
+    ['ne ', '!='],
+    ['eq ', '='],
+    ['contains '],
+    ['datestartswith '],
+]
+
+# Operators matching text, their value is never parsed as a number
+TEXT_OPERATORS = ('contains ', 'datestartswith ')
+
+FILTER_CACHE_SIZE = 64
+
+
+def split_filter_part(filter_part):
+    """
+    Split a single `{column} op value` clause into its parts.
+
+    Returns (column, operator, value) or (None, None, None) if the clause
+    can't be parsed.
+    """
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator not in filter_part:
+                continue
+            name_part, value_part = filter_part.split(operator, 1)
+            name = name_part[name_part.find('{') + 1:name_part.rfind('}')]
+
+            value_part = value_part.strip()
+            if value_part and value_part[0] == value_part[-1] and value_part[0] in ('"', "'", '`'):
+                value = re.sub(r'\\(.)', r'\1', value_part[1:-1])
+            elif operator_type[0] in TEXT_OPERATORS:
+                value = value_part
+            else:
+                try:
+                    value = float(value_part)
+                except ValueError:
+                    value = value_part
+
+            # word operators need a trailing space to be matched, drop it
+            return name, operator_type[0].strip(), value
+
+    return None, None, None
+
+
+class EventTable(object):
+    """
+    Paging backend over a DataFrame of events.
+
+    df: pd.DataFrame, rows are addressed by position so any index is fine
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.columns = list(self.df.columns)
+        self._sort_index = {}
+        self._nan_count = {}
+        for col in self.columns:
+            series = self.df[col]
+            order = series.sort_values(kind='mergesort', na_position='last').index
+            self._sort_index[col] = order.to_numpy(dtype=np.int64)
+            self._nan_count[col] = int(series.isna().sum())
+
+        # Cached per instance so a reload drops the old results with it
+        self._mask = lru_cache(maxsize=FILTER_CACHE_SIZE)(self._build_mask)
+        self._order = lru_cache(maxsize=FILTER_CACHE_SIZE)(self._build_order)
+
+    def __len__(self):
+        return len(self.df)
+
+    def _build_mask(self, filter_query):
+        """
+        Vectorized boolean mask for a dash_table `filter_query` string.
+        """
+        mask = np.ones(len(self.df), dtype=bool)
+        for part in filter_query.split(' && '):
+            col, operator, value = split_filter_part(part)
+            if col not in self._sort_index:
+                continue
+            series = self.df[col]
+
+            if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+                if series.dtype.kind in 'biuf' and not isinstance(value, float):
+                    # Comparing a number column against text never matches
+                    mask[:] = False
+                    continue
+                if series.dtype.kind not in 'biuf':
+                    series = series.astype(str)
+                    value = str(value) if not isinstance(value, float) or not value.is_integer() \
+                        else str(int(value))
+                part_mask = getattr(series, operator)(value)
+            elif operator == 'contains':
+                part_mask = series.astype(str).str.contains(str(value), regex=False)
+            elif operator == 'datestartswith':
+                part_mask = series.astype(str).str.startswith(str(value))
+            else:
+                continue
+
+            mask &= part_mask.fillna(False).to_numpy(dtype=bool)
+        return mask
+
+    def _sorted_position(self, col, ascending, start, stop):
+        """
+        Row positions [start, stop) of `col` sorted, NaNs always last.
+
+        Descending order is read backwards from the ascending index, so a
+        page costs O(page size) either way.
+        """
+        index = self._sort_index[col]
+        valid = len(index) - self._nan_count[col]
+        if ascending:
+            return index[start:stop]
+
+        positions = np.arange(start, min(stop, len(index)))
+        head = positions < valid
+        out = np.empty(len(positions), dtype=np.int64)
+        out[head] = index[valid - 1 - positions[head]]
+        out[~head] = index[positions[~head]]
+        return out
+
+    def _build_order(self, filter_query, sort_key):
+        """
+        Full row order for a filter/sort combination.
+
+        sort_key: tuple of (column, ascending) pairs
+        """
+        if len(sort_key) == 1:
+            col, ascending = sort_key[0]
+            order = self._sorted_position(col, ascending, 0, len(self.df))
+        elif sort_key:
+            order = self.df.sort_values(
+                [col for col, _ in sort_key],
+                ascending=[ascending for _, ascending in sort_key],
+                kind='mergesort',
+                na_position='last'
+            ).index.to_numpy(dtype=np.int64)
+        else:
+            order = np.arange(len(self.df), dtype=np.int64)
+
+        if filter_query:
+            order = order[self._mask(filter_query)[order]]
+        return order
+
+    def page(self, page_current, page_size, sort_by=None, filter_query=''):
+        """
+        Rows for one page of the table plus the total page count.
+
+        Arguments map to the DataTable `page_current`, `page_size`,
+        `sort_by` and `filter_query` properties.
+        """
+        page_current = page_current or 0
+        sort_key = tuple(
+            (s['column_id'], s['direction'] == 'asc')
+            for s in (sort_by or []) if s['column_id'] in self._sort_index
+        )
+        filter_query = (filter_query or '').strip()
+
+        start = page_current * page_size
+        stop = start + page_size
+        if not filter_query and len(sort_key) == 1:
+            # Fast path: straight out of the precomputed index
+            col, ascending = sort_key[0]
+            rows = self._sorted_position(col, ascending, start, stop)
+            total = len(self.df)
+        elif not filter_query and not sort_key:
+            rows = np.arange(start, min(stop, len(self.df)))
+            total = len(self.df)
+        else:
+            order = self._order(filter_query, sort_key)
+            rows = order[start:stop]
+            total = len(order)
+
+        page_count = max(1, -(-total // page_size))
+        return self.df.iloc[rows].to_dict('records'), page_count
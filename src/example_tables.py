@@ -1,13 +1,15 @@
+import os
+
 import dash
+import dash_html_components as html
+import dash_table
+import metrics
 import pandas as pd
-import plotly.graph_objs as go
-import dash_core_components as dcc
 from dash.dependencies import Input, Output
-import dash_html_components as html
-import dateutil.parser as parser
 
-mapbox_access_token = 'pk.eyJ1IjoiaXZhbm5pZXRvIiwiYSI6ImNqNTU0dHFrejBkZmoycW9hZTc5NW42OHEifQ._bi-c17fco0GQVetmZq0Hw'
+from event_table import EventTable
 
+app = dash.Dash(name=__name__)
 server = app.server
 
 
@@ -19,41 +21,69 @@ app.css.append_css({
     'external_url': [normalize_css, css_url]
 })
 
-df = pd.read_csv('src/data/fireballs.csv')
+# Whole processed event set, the table pages through it server side
+if(os.path.isfile('src/data/filtered_data.csv')):
+    df = pd.read_csv('src/data/filtered_data.csv')
+else:
+    df = pd.read_csv('src/data/fireballs.csv')
+    df["year"] = [int(x.split("-")[0]) for x in df.date.values]
+
+main_columns = [x for x in df.columns.values if x != 'legend']
+table = EventTable(df[main_columns])
+
+metrics.instrument(app)
+metrics.register_cache('events-table-filter', table._mask.cache_info)
+metrics.register_cache('events-table-order', table._order.cache_info)
 
-years = [int(parser.parse(i).year) for i in df['date']]
+PAGE_SIZE = 50
 
 # GENERACION DE TABLAS CON LOS DATOS IMPORTADOS
 
-def generate_table(df, max_rows=50):
+
+def generate_table(table, page_size=PAGE_SIZE):
+    first_page, _ = table.page(0, page_size)
     return html.Div(
       className='container',
       children=[
         html.H1('GREAT BALLS OF FIRE DATA'),
-        html.Table(
-            className='table',
-            # Header
-            children=[
-              html.Tr([
-                html.Th(col) for col in main_columns
-              ])
-            ]
-            +
-            # Body
-            [
-              html.Tr([
-                html.Td(df.iloc[i][col]) for col in main_columns
-              ]) for i in range(min(len(df), max_rows))
-            ],
-        )        
+        dash_table.DataTable(
+            id='events-table',
+            columns=[{'name': col, 'id': col} for col in table.columns],
+            data=first_page,
+            pagination_mode='be',
+            pagination_settings={
+                'current_page': 0,
+                'page_size': page_size
+            },
+            sorting='be',
+            sorting_type='multi',
+            sort_by=[],
+            filtering='be',
+            filter='',
+        )
       ]
     )
 
-df["year"] = [int(x.split("-")[0]) for x in df.date.values]
-main_columns = df.columns.values
 
 # GENERACION DE GRAPH
-app.layout = generate_table(df, max_rows=50)
+# The layout has to exist before callbacks can be registered against it
+app.layout = generate_table(table, page_size=PAGE_SIZE)
+
+
+@app.callback(
+    Output('events-table', 'data'),
+    [Input('events-table', 'pagination_settings'),
+     Input('events-table', 'sort_by'),
+     Input('events-table', 'filter')]
+)
+def update_table(pagination_settings, sort_by, filter_query):
+    """
+    Serve only the visible page of the table
+    """
+    rows, _ = table.page(pagination_settings['current_page'], pagination_settings['page_size'],
+                         sort_by, filter_query)
+    return rows
+
 
 if __name__ == '__main__':
     app.run_server(debug=True, port=9000)
@@ -0,0 +1,264 @@
+"""
+Streaming bulk export of the events behind the current view.
+
+    GET /export?format=csv&year=2015
+    GET /export?format=geojson&year_min=2005&year_max=2010&bbox=-10,35,5,44
+    GET /export?format=arrow
+
+Rows are selected with a vectorized mask and written out in chunks from a
+generator, so only one chunk is ever serialized at a time and the first
+bytes leave the server straight away.
+
+Interrupted downloads can be resumed by row: send `Range: rows=<first>-`
+(or `?offset=<first>`) and the answer is a 206 carrying
+`Content-Range: rows <first>-<last>/<total>`. Row ranges are used instead
+of byte ranges because the byte size of a streamed export isn't known
+until it has been written. A Range header in any other unit (such as the
+`bytes=` of curl, wget or browsers) is ignored and the whole export is sent.
+
+A resumed CSV continues the earlier body (the header isn't repeated), so it
+can be appended to the partial file. GeoJSON and Arrow have a document
+envelope: a resumed export of those is a standalone document holding just
+the requested rows, to be merged feature by feature or batch by batch
+rather than appended.
+"""
+
+import json
+import re
+
+from flask import Response, request
+
+
+CHUNK_ROWS = 10000
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+}
+
+RANGE_RE = re.compile(r'^rows=(\d+)-(\d*)$')
+
+
+class ExportError(ValueError):
+    pass
+
+
+class RangeNotSatisfiable(ExportError):
+    pass
+
+
+def select_rows(df, args):
+    """
+    Row positions of `df` matching the export filter in `args`.
+
+    Supported filters: year, year_min, year_max and
+    bbox=west,south,east,north (degrees).
+    """
+    import numpy as np
+
+    mask = np.ones(len(df), dtype=bool)
+    try:
+        if args.get('year'):
+            mask &= df['year'].values == int(args['year'])
+        if args.get('year_min'):
+            mask &= df['year'].values >= int(args['year_min'])
+        if args.get('year_max'):
+            mask &= df['year'].values <= int(args['year_max'])
+        if args.get('bbox'):
+            west, south, east, north = [float(x) for x in args['bbox'].split(',')]
+            lat = df['lat'].values
+            lon = df['lon'].values
+            mask &= (lat >= south) & (lat <= north)
+            if west <= east:
+                mask &= (lon >= west) & (lon <= east)
+            else:
+                # box crossing the antimeridian
+                mask &= (lon >= west) | (lon <= east)
+    except ValueError:
+        raise ExportError('Malformed filter parameters')
+
+    return np.flatnonzero(mask)
+
+
+def parse_range(range_header, offset, total):
+    """
+    First and last (inclusive) row to send, or None for the whole result.
+
+    Ranges in units other than rows are ignored (RFC 7233).
+    """
+    range_header = (range_header or '').strip()
+    if range_header.startswith('rows='):
+        match = RANGE_RE.match(range_header)
+        if not match:
+            raise ExportError('Only "rows=<first>-[<last>]" ranges are supported')
+        first = int(match.group(1))
+        last = int(match.group(2)) if match.group(2) else total - 1
+    elif offset:
+        try:
+            first = int(offset)
+        except ValueError:
+            raise ExportError('Malformed offset')
+        if first < 0:
+            raise ExportError('Malformed offset')
+        last = total - 1
+    else:
+        return None
+
+    if total == 0 and first == 0:
+        # nothing selected, answer with the whole (empty) result
+        return None
+    if first >= total or last < first:
+        raise RangeNotSatisfiable('Range not satisfiable')
+    return first, min(last, total - 1)
+
+
+def iter_chunks(df, rows):
+    for start in range(0, len(rows), CHUNK_ROWS):
+        yield df.iloc[rows[start:start + CHUNK_ROWS]]
+
+
+def stream_csv(df, rows, header=True):
+    if header and not len(rows):
+        yield df.iloc[:0].to_csv(index=False)
+    for chunk in iter_chunks(df, rows):
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+
+
+def stream_geojson(df, rows):
+    properties = [x for x in df.columns if x not in ('lat', 'lon')]
+    yield '{"type": "FeatureCollection", "features": ['
+    separator = ''
+    for chunk in iter_chunks(df, rows):
+        # NaN is not valid JSON, send nulls instead
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        features = []
+        for lat, lon, props in zip(chunk['lat'], chunk['lon'],
+                                   chunk[properties].to_dict('records')):
+            features.append(json.dumps({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                'properties': props,
+            }))
+        if features:
+            yield separator + ','.join(features)
+            separator = ','
+    yield ']}'
+
+
+class _Drain(object):
+    """
+    File-like sink handing back whatever pyarrow wrote since the last call.
+    """
+
+    def __init__(self):
+        self.buffers = []
+        self.closed = False
+
+    def write(self, data):
+        self.buffers.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.buffers)
+        self.buffers = []
+        return data
+
+
+def arrow():
+    """
+    pyarrow if it is installed, Arrow export is optional
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def arrow_schema(pa, df):
+    """
+    Arrow schema of `df`, text columns declared as strings
+
+    Types inferred from zero rows leave object columns as `null`, and the
+    first batch holding actual text would fail to convert.
+    """
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+    return schema
+
+
+def stream_arrow(df, rows):
+    pa = arrow()
+    schema = arrow_schema(pa, df)
+    sink = _Drain()
+    writer = pa.ipc.new_stream(sink, schema)
+    for chunk in iter_chunks(df, rows):
+        writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def register_export(server, get_df):
+    """
+    Add the /export route to the Flask `server`.
+
+    get_df: callable returning the processed events DataFrame
+    """
+
+    @server.route('/export')
+    def export():
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in FORMATS:
+            return Response('Unknown format, use one of: {}'.format(', '.join(FORMATS)), status=400)
+        if fmt == 'arrow' and arrow() is None:
+            return Response('Arrow export needs pyarrow installed', status=501)
+
+        df = get_df()
+        try:
+            rows = select_rows(df, request.args)
+        except ExportError as e:
+            return Response(str(e), status=400)
+
+        total = len(rows)
+        try:
+            span = parse_range(request.headers.get('Range'), request.args.get('offset'), total)
+        except RangeNotSatisfiable as e:
+            return Response(str(e), status=416, headers={'Content-Range': 'rows */{}'.format(total)})
+        except ExportError as e:
+            return Response(str(e), status=400)
+
+        mimetype, extension = FORMATS[fmt]
+        headers = {
+            'Accept-Ranges': 'rows',
+            'X-Total-Rows': str(total),
+            'Content-Disposition': 'attachment; filename=fireballs.{}'.format(extension),
+        }
+        status = 200
+        if span is not None:
+            first, last = span
+            rows = rows[first:last + 1]
+            headers['Content-Range'] = 'rows {}-{}/{}'.format(first, last, total)
+            status = 206
+
+        if fmt == 'csv':
+            # A resumed CSV continues the previous body, don't repeat the header
+            body = stream_csv(df, rows, header=span is None or span[0] == 0)
+        elif fmt == 'geojson':
+            body = stream_geojson(df, rows)
+        else:
+            body = stream_arrow(df, rows)
+
+        return Response(body, status=status, mimetype=mimetype, headers=headers)
+
+    return export
@@ -0,0 +1,381 @@
+"""
+Per-callback instrumentation for Dash apps, exposed as Prometheus text.
+
+    metrics.instrument(app)   # every callback of `app`, plus GET /metrics
+
+Every `_dash-update-component` request is timed and labelled with the
+callback function and output it resolves to. For each callback:
+
+dash_callback_duration_seconds.......latency histogram (compute + serialization)
+dash_callback_response_bytes.........serialized response size histogram
+dash_callback_input_cardinality......number of input values (list lengths summed)
+dash_callback_errors_total...........failed calls
+
+lru caches registered with `register_cache()` are reported as
+dash_cache_hits_total / dash_cache_misses_total.
+
+Counters live in each process. Under several gunicorn workers set
+METRICS_DIR to an empty directory shared by the workers: each one then
+flushes its counters there (at most every METRICS_FLUSH_SECONDS and on
+every scrape) and /metrics reports the sum over all of them, whichever
+worker answers. The files of workers that exited are kept so totals never
+go backwards; empty the directory when the whole server restarts. Without
+METRICS_DIR every series is labelled with the `pid` of the worker that
+answered the scrape.
+
+Set PROFILE_SLOW_MS to sample the stack of each callback call every
+PROFILE_INTERVAL_MS and dump calls slower than the threshold to
+PROFILE_DIR as folded stacks (one `frame;frame;frame count` line per
+stack), ready for flamegraph.pl or speedscope.
+"""
+
+import atexit
+import glob
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from collections import defaultdict
+
+from flask import Response, g, request
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+CARDINALITY_BUCKETS = (1, 2, 5, 10, 100, 1000, 10000)
+
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 1))
+
+# Numbers the dumps of this process, names stay unique within a second
+_dump_count = itertools.count()
+
+UPDATE_PATH = '_dash-update-component'
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def add(self, counts, total):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else '{:g}'.format(bound)
+            yield '{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, cumulative)
+        yield '{}_sum{{{}}} {}'.format(name, labels, self.sum)
+        yield '{}_count{{{}}} {}'.format(name, labels, cumulative)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.size = defaultdict(lambda: Histogram(BYTES_BUCKETS))
+        self.cardinality = defaultdict(lambda: Histogram(CARDINALITY_BUCKETS))
+        self.errors = defaultdict(int)
+        self.caches = {}
+        # hits and misses merged in from other processes
+        self.cache_counts = defaultdict(lambda: [0, 0])
+
+    def observe(self, key, seconds, size, cardinality, error):
+        with self.lock:
+            self.duration[key].observe(seconds)
+            self.cardinality[key].observe(cardinality)
+            if error:
+                self.errors[key] += 1
+            else:
+                self.size[key].observe(size)
+                # so the series is exported before the first error
+                self.errors.setdefault(key, 0)
+
+    def histograms(self):
+        return (('dash_callback_duration_seconds', self.duration),
+                ('dash_callback_response_bytes', self.size),
+                ('dash_callback_input_cardinality', self.cardinality))
+
+    def snapshot(self):
+        """
+        JSON-serializable copy of every counter, see `add`.
+        """
+        with self.lock:
+            state = {
+                name: [[key[0], key[1], hist.counts, hist.sum] for key, hist in series.items()]
+                for name, series in self.histograms()
+            }
+            state['errors'] = [[key[0], key[1], count] for key, count in self.errors.items()]
+            caches = list(self.caches.items())
+            state['caches'] = {name: list(counts) for name, counts in self.cache_counts.items()}
+        for name, cache_info in caches:
+            info = cache_info()
+            hits, misses = state['caches'].get(name, (0, 0))
+            state['caches'][name] = [hits + info.hits, misses + info.misses]
+        return state
+
+    def add(self, state):
+        """
+        Sum the counters of another registry's `snapshot()` into this one.
+        """
+        with self.lock:
+            for name, series in self.histograms():
+                for callback, output, counts, total in state.get(name, []):
+                    series[(callback, output)].add(counts, total)
+            for callback, output, count in state.get('errors', []):
+                self.errors[(callback, output)] += count
+            for name, (hits, misses) in state.get('caches', {}).items():
+                self.cache_counts[name][0] += hits
+                self.cache_counts[name][1] += misses
+
+    def render(self, extra_labels=''):
+        """
+        Prometheus text of every counter, `extra_labels` added to each series.
+        """
+        def labels(key):
+            return series_labels(key) + extra_labels
+
+        out = []
+        with self.lock:
+            for name, kind, help_text, series in (
+                    ('dash_callback_duration_seconds', 'histogram',
+                     'Callback latency, compute and serialization', self.duration),
+                    ('dash_callback_response_bytes', 'histogram',
+                     'Serialized callback response size', self.size),
+                    ('dash_callback_input_cardinality', 'histogram',
+                     'Number of input values per call', self.cardinality)):
+                out.append('# HELP {} {}'.format(name, help_text))
+                out.append('# TYPE {} {}'.format(name, kind))
+                for key in sorted(series):
+                    out.extend(series[key].lines(name, labels(key)))
+
+            out.append('# HELP dash_callback_errors_total Failed callback calls')
+            out.append('# TYPE dash_callback_errors_total counter')
+            for key in sorted(self.errors):
+                out.append('dash_callback_errors_total{{{}}} {}'.format(labels(key), self.errors[key]))
+            caches = list(self.caches.items())
+            counts = {name: list(value) for name, value in self.cache_counts.items()}
+
+        for name, cache_info in caches:
+            info = cache_info()
+            hits, misses = counts.get(name, (0, 0))
+            counts[name] = [hits + info.hits, misses + info.misses]
+
+        out.append('# HELP dash_cache_hits_total Cache hits')
+        out.append('# TYPE dash_cache_hits_total counter')
+        out.append('# HELP dash_cache_misses_total Cache misses')
+        out.append('# TYPE dash_cache_misses_total counter')
+        for name, (hits, misses) in sorted(counts.items()):
+            out.append('dash_cache_hits_total{{cache="{}"{}}} {}'.format(escape(name), extra_labels, hits))
+            out.append('dash_cache_misses_total{{cache="{}"{}}} {}'.format(escape(name), extra_labels, misses))
+
+        return '\n'.join(out) + '\n'
+
+
+registry = Registry()
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_flush_timer = None
+
+
+def series_labels(key):
+    callback, output = key
+    return 'callback="{}",output="{}"'.format(escape(callback), escape(output))
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def flush(force=False):
+    """
+    Write this process' counters to METRICS_DIR for the other workers.
+    """
+    global _last_flush, _flush_timer
+    if not METRICS_DIR:
+        return
+    with _flush_lock:
+        now = time.time()
+        wait = _last_flush + METRICS_FLUSH_SECONDS - now
+        if not force and wait > 0:
+            if _flush_timer is None:
+                # write these calls out at the end of the interval, even if idle by then
+                _flush_timer = threading.Timer(wait, flush, [True])
+                _flush_timer.daemon = True
+                _flush_timer.start()
+            return
+        _flush_timer = None
+        _last_flush = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, 'metrics-{}.json'.format(os.getpid()))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, path)
+
+
+def render():
+    """
+    Body of /metrics: this process alone, or the sum over METRICS_DIR.
+    """
+    if not METRICS_DIR:
+        return registry.render(',pid="{}"'.format(os.getpid()))
+
+    flush(force=True)
+    total = Registry()
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+        try:
+            with open(path) as f:
+                total.add(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return total.render()
+
+
+def register_cache(name, cache_info):
+    """
+    Report an lru cache, `cache_info` being its `cache_info` method.
+    """
+    with registry.lock:
+        registry.caches[name] = cache_info
+
+
+def cardinality(inputs):
+    total = 0
+    for item in inputs or []:
+        if isinstance(item, list):
+            # pattern matching inputs come as nested lists
+            total += cardinality(item)
+            continue
+        value = item.get('value') if isinstance(item, dict) else item
+        total += len(value) if isinstance(value, (list, tuple, dict)) else 1
+    return total
+
+
+def callback_name(app, output):
+    """
+    Name of the function registered for `output`, or the output itself.
+    """
+    entry = app.callback_map.get(output, {})
+    func = entry.get('callback')
+    if func is None:
+        return output
+    return getattr(getattr(func, '__wrapped__', func), '__name__', output)
+
+
+class Sampler(threading.Thread):
+    """
+    Collect folded stacks of one thread until stopped.
+    """
+
+    def __init__(self, thread_id, interval):
+        super(Sampler, self).__init__(name='metrics-sampler')
+        self.daemon = True
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+
+def instrument(app, path='/metrics'):
+    """
+    Record metrics for every callback of `app` and serve them at `path`.
+    """
+    server = app.server
+    if METRICS_DIR:
+        # keep the last calls of a worker that is shutting down
+        atexit.register(flush, True)
+
+    def is_update():
+        return request.path.endswith(UPDATE_PATH) and request.method == 'POST'
+
+    @server.before_request
+    def start_timer():
+        if not is_update():
+            return
+        g.metrics_start = time.perf_counter()
+        if PROFILE_SLOW_MS:
+            g.metrics_sampler = Sampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0)
+            g.metrics_sampler.start()
+
+    def finish(size, error):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        body = request.get_json(silent=True) or {}
+        output = body.get('output', '')
+        key = (callback_name(app, output), output)
+        registry.observe(key, elapsed, size, cardinality(body.get('inputs')), error)
+        flush()
+
+        sampler = g.pop('metrics_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                sampler.dump(os.path.join(PROFILE_DIR, '{}-{}-{}-{}.folded'.format(
+                    key[0], time.strftime('%Y%m%d-%H%M%S'), os.getpid(), next(_dump_count))))
+
+    @server.after_request
+    def record(response):
+        if 'metrics_start' in g:
+            size = 0 if response.is_streamed else len(response.get_data())
+            finish(size, response.status_code >= 400)
+        return response
+
+    @server.teardown_request
+    def record_error(exc):
+        # after_request is skipped when the callback raised
+        if exc is not None and 'metrics_start' in g:
+            finish(0, True)
+
+    @server.route(path)
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    return registry
@@ -0,0 +1,92 @@
+"""
+Derived trajectory and energy metrics, computed for all events at once.
+
+Field 	      Description
+__________________________________________________________________________
+speed.........pre-entry speed, |(vx, vy, vz)| (km/s)
+entry-angle...entry angle above the local horizon at peak brightness (degrees)
+radiant-ra....right ascension of the radiant (degrees)
+radiant-dec...declination of the radiant (degrees)
+energy-kt.....total radiated energy in kt of TNT
+impact-e-j....total impact energy in joules
+mass..........estimated pre-entry mass, 2 E / v^2 (kg)
+
+The velocity components are taken as Earth fixed (ECEF), the way the API
+publishes them; the radiant is the opposite of the velocity vector turned
+into the celestial frame with the Greenwich mean sidereal time of the event.
+Events without `vx`/`vy`/`vz` get NaN for the trajectory metrics, and the
+mass falls back on the velocity at peak brightness.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+KT_TO_J = 4.184e12
+# The API reports radiated energy in units of 10^10 J
+RADIATED_ENERGY_UNIT = 1e10
+
+DERIVED_COLUMNS = ['speed', 'entry-angle', 'radiant-ra', 'radiant-dec', 'energy-kt', 'impact-e-j', 'mass']
+
+
+def column(df, name):
+    if name in df:
+        return df[name].to_numpy(dtype=float)
+    return np.full(len(df), np.nan)
+
+
+def gmst(dates):
+    """
+    Greenwich mean sidereal time (degrees) for an array of UTC dates
+    """
+    seconds = pd.to_datetime(dates).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    days = seconds / 86400.0 + 2440587.5 - 2451545.0
+    return np.mod(280.46061837 + 360.98564736629 * days, 360.0)
+
+
+def derive(df):
+    """
+    df: pd.DataFrame of processed events
+
+    Returns a DataFrame with DERIVED_COLUMNS, aligned with `df`.
+    """
+    v = np.column_stack([column(df, 'vx'), column(df, 'vy'), column(df, 'vz')])
+    speed = np.sqrt(np.einsum('ij,ij->i', v, v))
+
+    lat = np.radians(column(df, 'lat'))
+    lon = np.radians(column(df, 'lon'))
+    up = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # descending objects move against the local vertical
+        entry_angle = np.degrees(np.arcsin(np.clip(-np.einsum('ij,ij->i', v, up) / speed, -1, 1)))
+        radiant = -v / speed[:, None]
+        dec = np.degrees(np.arcsin(np.clip(radiant[:, 2], -1, 1)))
+        ra = np.mod(np.degrees(np.arctan2(radiant[:, 1], radiant[:, 0])) + gmst(df['date']), 360.0)
+
+        impact_j = column(df, 'impact-e') * KT_TO_J
+        mass_speed = np.where(np.isnan(speed), column(df, 'vel'), speed) * 1000.0
+        mass = 2 * impact_j / mass_speed ** 2
+
+    return pd.DataFrame({
+        'speed': speed,
+        'entry-angle': entry_angle,
+        'radiant-ra': ra,
+        'radiant-dec': dec,
+        'energy-kt': column(df, 'energy') * RADIATED_ENERGY_UNIT / KT_TO_J,
+        'impact-e-j': impact_j,
+        'mass': mass,
+    }, index=df.index, columns=DERIVED_COLUMNS)
+
+
+def with_derived(df):
+    """
+    Add the derived columns to `df`.
+
+    Recomputing takes a few milliseconds even at 100x the events, faster
+    than reading them back from a file, so nothing is cached.
+    """
+    derived = derive(df)
+    for col in DERIVED_COLUMNS:
+        df[col] = derived[col].to_numpy()
+    return df
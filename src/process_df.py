@@ -1,12 +1,17 @@
-import numpy as np 
+import numpy as np
 import geocoder
 
 
-def process_df(df):
+PENDING_LOCATION = "Location: pending<br>"
+
+
+def clean_df(df):
     """
     df: pd.DataFrame
+
+    Drop events without coordinates, add the year and sign the coordinates
     """
-    
+
     df.dropna(subset=['lat', 'lon'], axis=0, inplace=True)
     df.reset_index(drop=True, inplace=True)
     # Add new column to hold the years
@@ -19,21 +24,46 @@ def process_df(df):
     lon_flip = np.logical_and(df["lon-dir"] == "W", df["lon"] >= 0)
     df.loc[lon_flip, "lon"] *= -1
 
+    return df
+
+
+def format_legend(location, impact_e, date):
+    if impact_e < 10:
+        return '{}<10 kt<br>{}'.format(location, str(date))
+    return '{}{} kt<br>{}'.format(location, impact_e, str(date))
+
+
+def placeholder_legend(df):
+    """
+    Legends for events that haven't been geocoded yet
+    """
+    return [format_legend(PENDING_LOCATION, impact_e, date)
+            for impact_e, date in zip(df['impact-e'], df['date'])]
+
+
+def geocode_location(lat, lon):
+    """
+    Reverse geocode a point into the legend location line
+    """
+    g = geocoder.google([lat, lon], method='reverse')
+    city = '{}'.format(g.city) if g.city else "N/A"
+    country = '{}'.format(g.country) if g.country else "N/A"
+    return "Location: {},{}<br>".format(city, country)
+
+
+def process_df(df):
+    """
+    df: pd.DataFrame
+    """
+
+    df = clean_df(df)
+
     legend = []
     print('Starting to pull data from Google Geolocation API')
     for i in range(len(df['impact-e'])):
         print(i+1, "of {}".format(len(df)+1))
-        g = geocoder.google([df['lat'][i], df['lon'][i]], method='reverse')
-        city = '{}'.format(g.city) if g.city else "N/A"
-        country = '{}'.format(g.country) if g.country else "N/A"
-
-        if city is not None and country is not None:
-            location = "Location: {},{}<br>".format(city, country)
-        
-        if df['impact-e'][i] < 10:
-            legend.append('{}<10 kt<br>{}'.format(location, str(df['date'][i])))
-        else:
-            legend.append('{}{} kt<br>{}'.format(location, df['impact-e'][i], str(df['date'][i])))
+        location = geocode_location(df['lat'][i], df['lon'][i])
+        legend.append(format_legend(location, df['impact-e'][i], df['date'][i]))
 
     df['legend'] = legend
 
@@ -0,0 +1,114 @@
+"""
+Measure how fast the app boots and check it against a budget.
+
+    python src/startup_budget.py
+
+Each run happens in a fresh interpreter (as under a new gunicorn worker) and
+records:
+
+import............seconds to `import app`
+first-response....seconds from process start to the first answer of /ready
+ready.............seconds until /ready reports the data as loaded
+layout............seconds until the first /_dash-layout is served
+
+The median of --runs is compared to the budgets below (overridable with
+the BUDGET_* environment variables); the script exits with 1 if any of
+them is exceeded.
+
+Measured on a single core Linux box, Python 3.11, Dash 0.43 / plotly 3.10,
+median of 7 runs with the bundled data:
+
+            import  first-response  ready  layout
+fast start  0.63s   0.63s           0.66s  0.66s
+eager       0.61s   0.62s           0.62s  0.62s
+
+With 100x the events (53,700) the fast start keeps importing in 0.67s and
+is ready at 0.97s, while the eager import takes 0.92s. ~0.59s of the
+import is `dash` itself importing plotly. The budgets leave ~40% of
+headroom over those numbers.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+BUDGETS = {
+    'import': float(os.environ.get('BUDGET_IMPORT', 0.9)),
+    'first-response': float(os.environ.get('BUDGET_FIRST_RESPONSE', 0.9)),
+    'ready': float(os.environ.get('BUDGET_READY', 1.4)),
+    'layout': float(os.environ.get('BUDGET_LAYOUT', 1.4)),
+}
+
+PROBE = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.server.test_client()
+response = client.get('/ready')
+first = time.perf_counter()
+while response.status_code == 503:
+    time.sleep(0.01)
+    response = client.get('/ready')
+ready = time.perf_counter()
+client.get('/_dash-layout')
+layout = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'first-response': first - start,
+    'ready': ready - start,
+    'layout': layout - start,
+    'status': response.status_code,
+}))
+'''
+
+
+def measure(fast_start=True):
+    """
+    Boot the app once in a new interpreter and return its timings.
+    """
+    env = dict(os.environ)
+    env['FAST_START'] = '1' if fast_start else '0'
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(os.getcwd(), 'src'), env.get('PYTHONPATH', '')])
+    out = subprocess.check_output([sys.executable, '-c', PROBE], env=env)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--eager', action='store_true',
+                        help='measure with FAST_START=0 for comparison')
+    args = parser.parse_args()
+
+    runs = [measure(fast_start=not args.eager) for _ in range(args.runs)]
+
+    failed = False
+    for name, budget in sorted(BUDGETS.items()):
+        value = median([run[name] for run in runs])
+        ok = value <= budget
+        failed = failed or not ok
+        print('{:.<18}{:7.3f}s  (budget {:.1f}s) {}'.format(
+            name, value, budget, 'ok' if ok else 'OVER BUDGET'))
+
+    if any(run['status'] != 200 for run in runs):
+        print('data failed to load')
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
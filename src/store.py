@@ -0,0 +1,216 @@
+"""
+Event data shared by the app, loaded on first use.
+
+Nothing here touches pandas or the CSV files at import time. The first
+call to `frame()`/`stats()` (or a `warm_up()` started at boot) reads and
+processes the data once; every later call returns the cached result.
+
+`layout_meta()` gives what the page layout needs (years, explorer columns)
+without waiting for the data: from a JSON snapshot written after every
+load, else the copy shipped with the repo, or a plain scan of the CSV.
+The runtime snapshot is not tracked; `python src/store.py` refreshes the
+shipped copy when the bundled data changes.
+"""
+
+import csv
+import json
+import os
+import threading
+
+
+DATA_PATH = 'src/data/filtered_data.csv'
+RAW_PATH = 'src/data/fireballs.csv'
+SNAPSHOT_PATH = 'src/data/layout_snapshot.json'
+SHIPPED_SNAPSHOT_PATH = 'src/data/layout_snapshot.dist.json'
+
+# Columns that are not offered in the axis explorer
+to_skip = ['lat', 'lat-dir', 'lon', 'lon-dir', 'year', 'date']
+
+_lock = threading.RLock()
+_state = {}
+
+
+def prepare(df):
+    """
+    Build the cached state (frame, per-year stats, explorer columns)
+    from a processed events DataFrame.
+    """
+    import physics
+
+    df = physics.with_derived(df)
+
+    state = {}
+    state['max'] = df.groupby('year', as_index=False)[
+        ['alt', 'vel', 'impact-e', 'energy']].max()
+
+    state['mean'] = df.groupby('year', as_index=False)[
+        ['alt', 'vel', 'impact-e', 'energy']].mean()
+
+    state['median'] = df.groupby('year', as_index=False)[
+        ['alt', 'vel', 'impact-e', 'energy']].median()
+
+    # Get all valuable column headers, metrics the data lacks are left out
+    state['main_columns'] = [x for x in df.columns if x not in to_skip and df[x].notna().any()]
+
+    state['meta'] = {
+        'years': [int(x) for x in sorted(df['year'].unique())],
+        'main_columns': state['main_columns'],
+    }
+
+    state['df'] = df
+    return state
+
+
+def read():
+    """
+    Read the processed events from disk.
+
+    Without a processed file the raw events are served right away with
+    placeholder legends, and the geocoding runs in the background.
+    """
+    import pandas as pd
+
+    if(os.path.isfile(DATA_PATH)):
+        return pd.read_csv(DATA_PATH)
+
+    import enrichment
+    from process_df import clean_df, placeholder_legend
+
+    df = clean_df(pd.read_csv(RAW_PATH))
+    df['legend'] = placeholder_legend(df)
+    enrichment.start(df.copy(), DATA_PATH, update_legend)
+    return df
+
+
+def update_legend(positions, legends):
+    """
+    Swap in geocoded legends for the events at `positions`.
+    """
+    with _lock:
+        df = _state.get('df')
+        if df is None:
+            return
+        # Replace the whole column so readers see either the old or the new one
+        legend = df['legend'].copy()
+        legend.iloc[positions] = legends
+        df['legend'] = legend
+
+
+def load():
+    """
+    Load the data if it isn't loaded yet and return the cached state.
+    """
+    if 'df' in _state:
+        return _state
+    with _lock:
+        if 'df' not in _state:
+            try:
+                _state.update(prepare(read()))
+            except Exception as e:
+                _state['error'] = e
+                raise
+            _state.pop('error', None)
+            write_snapshot(_state['meta'])
+    return _state
+
+
+def write_snapshot(meta, path=SNAPSHOT_PATH):
+    """
+    Keep the layout metadata for the next boot, unless it is unchanged.
+    """
+    if read_snapshot(path) == meta:
+        return
+    try:
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Read-only deploys scan the CSV on the next boot instead
+        pass
+
+
+def read_snapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def scan_meta():
+    """
+    Layout metadata straight from the CSV header and date column
+    """
+    path = DATA_PATH if os.path.isfile(DATA_PATH) else RAW_PATH
+    with open(path, newline='') as f:
+        rows = csv.DictReader(f)
+        years = set(int(row['date'][:4]) for row in rows)
+        columns = rows.fieldnames
+    return {
+        'years': sorted(years),
+        'main_columns': [x for x in columns if x not in to_skip],
+    }
+
+
+def layout_meta():
+    """
+    Years and explorer columns for the layout, never waits for the data.
+    """
+    if is_ready():
+        return _state['meta']
+    return read_snapshot() or read_snapshot(SHIPPED_SNAPSHOT_PATH) or scan_meta()
+
+
+def use_frame(df):
+    """
+    Replace the cached data with an already processed DataFrame.
+    """
+    with _lock:
+        _state.clear()
+        _state.update(prepare(df))
+
+
+def frame():
+    return load()['df']
+
+
+def stats(name):
+    """
+    Per-year aggregate: 'max', 'mean' or 'median'
+    """
+    return load()[name]
+
+
+def main_columns():
+    return load()['main_columns']
+
+
+def is_ready():
+    return 'df' in _state
+
+
+def error():
+    return _state.get('error')
+
+
+def warm_up():
+    """
+    Load the data in a background thread so the server can answer
+    requests in the meantime.
+    """
+    def run():
+        try:
+            load()
+        except Exception:
+            # Kept in _state['error'] and reported by the readiness check
+            pass
+
+    thread = threading.Thread(target=run, name='store-warm-up')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    write_snapshot(load()['meta'], SHIPPED_SNAPSHOT_PATH)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app modules are run flat from src/, as gunicorn --pythonpath ./src does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,51 @@
+import pytest
+
+from export import ExportError, RangeNotSatisfiable, parse_range
+
+
+def test_no_range_sends_everything():
+    assert parse_range(None, None, 43) is None
+    assert parse_range('', '', 43) is None
+
+
+def test_offset_resumes_to_the_end():
+    assert parse_range(None, '40', 43) == (40, 42)
+    assert parse_range(None, '0', 43) == (0, 42)
+
+
+def test_negative_offset_is_rejected():
+    with pytest.raises(ExportError) as e:
+        parse_range(None, '-40', 43)
+    assert not isinstance(e.value, RangeNotSatisfiable)
+
+
+def test_malformed_offset_is_rejected():
+    with pytest.raises(ExportError):
+        parse_range(None, 'forty', 43)
+
+
+def test_offset_past_the_end_is_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(None, '43', 43)
+
+
+def test_empty_result():
+    assert parse_range(None, '0', 0) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(None, '1', 0)
+
+
+def test_rows_range():
+    assert parse_range('rows=10-19', None, 43) == (10, 19)
+    assert parse_range('rows=10-', None, 43) == (10, 42)
+    # the last row is clipped to the result
+    assert parse_range('rows=10-100', None, 43) == (10, 42)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range('rows=20-10', None, 43)
+    with pytest.raises(ExportError):
+        parse_range('rows=-10', None, 43)
+
+
+def test_other_range_units_are_ignored():
+    assert parse_range('bytes=1024-', None, 43) is None
+    assert parse_range('bytes=1024-', '40', 43) == (40, 42)
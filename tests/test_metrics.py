@@ -0,0 +1,36 @@
+import json
+
+from functools import lru_cache
+
+from metrics import Registry
+
+
+def test_snapshots_add_up():
+    cached = lru_cache()(abs)
+    cached(1)
+    cached(1)
+
+    worker = Registry()
+    worker.caches['abs'] = cached.cache_info
+    worker.observe(('update_map', 'map-graph.figure'), 0.02, 2000, 1, False)
+    worker.observe(('update_map', 'map-graph.figure'), 3.0, 0, 1, True)
+
+    total = Registry()
+    # written to METRICS_DIR as JSON by every worker
+    state = json.loads(json.dumps(worker.snapshot()))
+    total.add(state)
+    total.add(state)
+
+    text = total.render()
+    assert 'dash_callback_duration_seconds_count{callback="update_map",output="map-graph.figure"} 4' in text
+    assert 'dash_callback_errors_total{callback="update_map",output="map-graph.figure"} 2' in text
+    assert 'dash_callback_response_bytes_count{callback="update_map",output="map-graph.figure"} 2' in text
+    assert 'dash_cache_hits_total{cache="abs"} 2' in text
+    assert 'dash_cache_misses_total{cache="abs"} 2' in text
+
+
+def test_extra_labels():
+    registry = Registry()
+    registry.observe(('update_text', 'this-year.children'), 0.001, 10, 1, False)
+    text = registry.render(',pid="42"')
+    assert 'dash_callback_errors_total{callback="update_text",output="this-year.children",pid="42"} 0' in text